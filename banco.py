@@ -4,38 +4,66 @@
     by Daniel Faustino. 2022-07-12.
 """
 
-from random import randint, getrandbits, shuffle
-from dataclasses import dataclass
-from typing import List
-from collections import Counter
-import operator
+from random import choices, getrandbits, shuffle, seed
+from dataclasses import dataclass, field
+from typing import Dict, List
+from multiprocessing import Pool
+import os
+import time
 from Dados import propriedades
 
-@dataclass
+# Tipos de comportamento
+IMPULSIVO = 0
+EXIGENTE = 1
+CAUTELOSO = 2
+ALEATORIO = 3
+
+# Nomes dos comportamentos, indexados pelo tipo
+COMPORTAMENTOS = ("impulsivo", "exigente", "cauteloso", "aleatorio")
+
+# Posições dos totais na lista de resultados de uma simulação. As vitórias
+# começam em VITORIAS e são indexadas pelo tipo de comportamento.
+TIMEOUT = 0
+TURNOS = 1
+VITORIAS = 2
+TAMANHO_RESULTADO = VITORIAS + len(COMPORTAMENTOS)
+
+# Valor de donos para uma propriedade sem dono
+SEM_DONO = -1
+
+# Faces de um dado de seis lados
+FACES_DADO = (1, 2, 3, 4, 5, 6)
+
+# Dados das propriedades lidos uma única vez: (nome, custo_venda, valor_aluguel)
+DADOS_PROPRIEDADES = tuple(
+    (prop["nome"], prop["custo_venda"], prop["valor_aluguel"]) for prop in propriedades.lista
+)
+
+@dataclass(slots=True)
 class Comportamento:
     """
     Classe que representa o comportamento de um jogador.
 
     Atributos
     ----------
-    impulsivo : bool
-        Compra qualquer propriedade sobre a qual ele parar.
-    exigente : bool
-        Compra qualquer propriedade, desde que o valor do aluguel dela seja maior do que 50.
-    cauteloso : bool
-        Compra qualquer propriedade desde que ele tenha uma reserva de 80 saldo sobrando depois de realizada a compra.
-    aleatorio : bool
-        Compra a propriedade que ele parar em cima com probabilidade de 50%.
+    tipo : int
+        Um dos tipos de comportamento:
+
+        IMPULSIVO
+            Compra qualquer propriedade sobre a qual ele parar.
+        EXIGENTE
+            Compra qualquer propriedade, desde que o valor do aluguel dela seja maior do que 50.
+        CAUTELOSO
+            Compra qualquer propriedade desde que ele tenha uma reserva de 80 saldo sobrando depois de realizada a compra.
+        ALEATORIO
+            Compra a propriedade que ele parar em cima com probabilidade de 50%.
 
     Métodos
     -------
     decide_compra(custo_propriedade, valor_aluguel, saldo):
         Decide se irá comprar uma propriedade baseado no comportamento do jogador.
     """
-    impulsivo: bool = False
-    exigente: bool = False
-    cauteloso: bool = False
-    aleatorio: bool = False
+    tipo: int
 
     def decide_compra(self, custo_propriedade, valor_aluguel, saldo):
         """Decide se irá comprar uma propriedade baseado no comportamento do jogador.
@@ -48,140 +76,211 @@ class Comportamento:
         Retorna:
             bool: True se compra, False se não compra.
         """
-        if self.impulsivo:
-            return True
-        if self.exigente and valor_aluguel >= 50:
-            return True
-        if self.cauteloso and (saldo - custo_propriedade) >= 80:
+        tipo = self.tipo
+        if tipo == IMPULSIVO:
             return True
-        if self.aleatorio:
-            return getrandbits(1) # Gera um bool aleatorio com 50% de chance
+        if tipo == EXIGENTE:
+            return valor_aluguel >= 50
+        if tipo == CAUTELOSO:
+            return (saldo - custo_propriedade) >= 80
 
-        return False
+        return getrandbits(1) == 1 # Gera um bool aleatorio com 50% de chance
 
 
-@dataclass
+@dataclass(slots=True)
 class Jogador:
-    """Representa um jogador dentro do jogo"""
+    """
+    Representa um jogador dentro do jogo.
+
+    Guarda o nome, o saldo inicial e o comportamento do jogador. O estado
+    durante a partida fica nas colunas de Jogo.
+    """
     nome: str
     saldo: int
     comportamento: Comportamento
-    posicao_tabuleiro: int = 0
-    falido: bool = False
-
-    def joga_dado(self):
-        """Joga um dado e retorna um numero de 1 a 6"""
-        valor = randint(1,6)
-        return valor
-
-    def executa_jogada(self, tabuleiro):
-        """Joga um dado, move-se pelo tabuleiro e decide"""
-        qtd_posicoes_andar = self.joga_dado()
-
-        if self.posicao_tabuleiro + qtd_posicoes_andar > 20:
-            self.posicao_tabuleiro = self.posicao_tabuleiro + qtd_posicoes_andar - 20
-            self.saldo += 100
-        else:
-            self.posicao_tabuleiro += qtd_posicoes_andar
-
-        propriedade = tabuleiro.propriedades[self.posicao_tabuleiro-1]
-
-        if not propriedade.dono:
-            compra = self.comportamento.decide_compra(propriedade.custo_venda, propriedade.valor_aluguel, self.saldo)
-
-            if compra:
-                propriedade.dono = self
-                self.saldo -= propriedade.custo_venda
-        else:
-            self.saldo -= propriedade.valor_aluguel
-
-        if self.saldo < 0:
-            self.falido = True
 
     def retorna_comportamento(self):
         """Retorna o nome do comportamento do jogador"""
-        if self.comportamento.impulsivo:
-            return "impulsivo"
-        if self.comportamento.exigente:
-            return "exigente"
-        if self.comportamento.cauteloso:
-            return "cauteloso"
-        if self.comportamento.aleatorio:
-            return "aleatorio"
+        return COMPORTAMENTOS[self.comportamento.tipo]
 
 
-@dataclass
+@dataclass(slots=True)
 class Propriedade:
     """Representa uma propriedade dentro do jogo"""
     nome: str
     custo_venda: int
     valor_aluguel: int
-    dono: Jogador = None
     posicao_tabuleiro: int = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Tabuleiro:
-    """Representa o tabuleiro"""
+    """
+    Representa o tabuleiro.
+
+    Os custos e aluguéis das propriedades são copiados para tuplas na
+    criação do tabuleiro, junto com a decisão de compra do comportamento
+    exigente, que depende apenas do aluguel. O índice do jogador dono de
+    cada propriedade fica em donos (SEM_DONO quando ninguém a comprou).
+    """
     propriedades: List[Propriedade]
+    custos: tuple = field(init=False, repr=False)
+    alugueis: tuple = field(init=False, repr=False)
+    compra_exigente: tuple = field(init=False, repr=False)
+    donos: List[int] = field(init=False, repr=False)
+    # Índices das propriedades de cada jogador, indexados pelo índice do jogador
+    propriedades_por_dono: Dict[int, List[int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.custos = tuple(propriedade.custo_venda for propriedade in self.propriedades)
+        self.alugueis = tuple(propriedade.valor_aluguel for propriedade in self.propriedades)
+        exigente = Comportamento(EXIGENTE)
+        self.compra_exigente = tuple(
+            exigente.decide_compra(custo_venda, valor_aluguel, 0)
+            for custo_venda, valor_aluguel in zip(self.custos, self.alugueis)
+        )
+        self.donos = [SEM_DONO] * len(self.propriedades)
 
-    def remove_jogador(self, jogador):
-        """Remove jogador de todas as propriedades"""
-        for propriedade in self.propriedades:
-            if propriedade.dono == jogador:
-                propriedade.dono = None
+    def registra_compra(self, indice_jogador, indice_propriedade):
+        """Define o jogador como dono da propriedade no índice informado"""
+        self.donos[indice_propriedade] = indice_jogador
+        self.propriedades_por_dono.setdefault(indice_jogador, []).append(indice_propriedade)
 
+    def remove_jogador(self, indice_jogador):
+        """Remove jogador de todas as suas propriedades"""
+        for indice_propriedade in self.propriedades_por_dono.pop(indice_jogador, ()):
+            self.donos[indice_propriedade] = SEM_DONO
+
+    def reset(self):
+        """Devolve todas as propriedades compradas ao banco"""
+        for indices_propriedades in self.propriedades_por_dono.values():
+            for indice_propriedade in indices_propriedades:
+                self.donos[indice_propriedade] = SEM_DONO
+        self.propriedades_por_dono.clear()
 
-@dataclass
+
+@dataclass(slots=True)
 class Jogo:
-    """Representa o jogo"""
+    """
+    Representa o jogo.
+
+    O estado dos jogadores durante a partida fica em colunas (saldos,
+    posicoes, falidos e comportamentos), indexadas pela posição do jogador
+    na lista jogadores.
+    """
     jogadores: List[Jogador]
     tabuleiro: Tabuleiro
     rodada: int = 0
     jogadores_falidos: int = 0
+    saldos: List[int] = field(init=False, repr=False)
+    posicoes: List[int] = field(init=False, repr=False)
+    falidos: List[bool] = field(init=False, repr=False)
+    comportamentos: List[Comportamento] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.saldos = [jogador.saldo for jogador in self.jogadores]
+        self.posicoes = [0] * len(self.jogadores)
+        self.falidos = [False] * len(self.jogadores)
+        self.comportamentos = [jogador.comportamento for jogador in self.jogadores]
+
+    def executa_jogada(self, indice_jogador, qtd_posicoes_andar):
+        """Move o jogador pelo tabuleiro o valor tirado no dado e decide"""
+        tabuleiro = self.tabuleiro
+
+        posicao = self.posicoes[indice_jogador] + qtd_posicoes_andar
+        saldo = self.saldos[indice_jogador]
+
+        # Completar uma volta no tabuleiro rende 100 de saldo
+        if posicao > 20:
+            posicao -= 20
+            saldo += 100
+        self.posicoes[indice_jogador] = posicao
+
+        indice_propriedade = posicao - 1
+
+        if tabuleiro.donos[indice_propriedade] == SEM_DONO:
+            custo_venda = tabuleiro.custos[indice_propriedade]
+            comportamento = self.comportamentos[indice_jogador]
+
+            if comportamento.tipo == EXIGENTE:
+                compra = tabuleiro.compra_exigente[indice_propriedade]
+            else:
+                compra = comportamento.decide_compra(
+                    custo_venda, tabuleiro.alugueis[indice_propriedade], saldo
+                )
+
+            if compra:
+                tabuleiro.registra_compra(indice_jogador, indice_propriedade)
+                saldo -= custo_venda
+        else:
+            saldo -= tabuleiro.alugueis[indice_propriedade]
+
+        self.saldos[indice_jogador] = saldo
+        if saldo < 0:
+            self.falidos[indice_jogador] = True
 
     def play(self):
-        """Joga o jogo e retorna os resultados"""
-        while self.rodada < 1000 and self.jogadores_falidos < 3:
-            for jogador in self.jogadores:
-                if jogador.falido:
+        """Joga o jogo e retorna (timeout, turnos, tipo do comportamento vencedor)"""
+        # Variáveis locais no laço principal evitam acessos a atributos a cada jogada
+        indices_jogadores = range(len(self.jogadores))
+        falidos = self.falidos
+        tabuleiro = self.tabuleiro
+        rodada = self.rodada
+        jogadores_falidos = self.jogadores_falidos
+        dados = joga_dados()
+
+        while rodada < 1000 and jogadores_falidos < 3:
+            for indice_jogador in indices_jogadores:
+                if falidos[indice_jogador]:
                     continue
 
-                jogador.executa_jogada(self.tabuleiro)
-                if jogador.falido:
-                    self.tabuleiro.remove_jogador(jogador)
-                    self.jogadores_falidos += 1
+                self.executa_jogada(indice_jogador, next(dados))
+                if falidos[indice_jogador]:
+                    tabuleiro.remove_jogador(indice_jogador)
+                    jogadores_falidos += 1
 
-                if self.jogadores_falidos > 2:
-                    break
+                    if jogadores_falidos > 2:
+                        break
 
-            self.rodada += 1
+            rodada += 1
 
-        time_out = 1 if self.rodada == 1000 and self.jogadores_falidos < 3 else 0
+        self.rodada = rodada
+        self.jogadores_falidos = jogadores_falidos
 
-        vencedor = None
-        for jogador in self.jogadores:
-            if not vencedor:
-                vencedor = jogador
-            elif jogador.saldo > vencedor.saldo:
-                vencedor = jogador
+        time_out = 1 if self.rodada == 1000 and self.jogadores_falidos < 3 else 0
 
+        if jogadores_falidos == 3:
+            # Apenas um jogador sobrou: ele é o vencedor, sem comparar saldos
+            indice_vencedor = falidos.index(False)
+        else:
+            indice_vencedor = max(indices_jogadores, key=self.saldos.__getitem__)
 
-        comportamento_vencedor = vencedor.retorna_comportamento()
-        resultado = {"timeout": time_out, "turnos": self.rodada, comportamento_vencedor: 1}
+        resultado = (time_out, self.rodada, self.comportamentos[indice_vencedor].tipo)
         self.reset()
 
-        return Counter(resultado)
+        return resultado
 
 
     def reset(self):
-        """Reseta as classes para limpeza"""
-        self.jogadores = None
-        self.tabuleiro = None
+        """Prepara o jogo para uma nova partida, reaproveitando jogadores e tabuleiro"""
+        shuffle(self.jogadores)
+        for indice_jogador, jogador in enumerate(self.jogadores):
+            self.saldos[indice_jogador] = jogador.saldo
+            self.posicoes[indice_jogador] = 0
+            self.falidos[indice_jogador] = False
+            self.comportamentos[indice_jogador] = jogador.comportamento
+
+        self.tabuleiro.reset()
         self.rodada = 0
         self.jogadores_falidos = 0
 
 
+def joga_dados(tamanho_bloco=64):
+    """Gera lançamentos de um dado, sorteados em blocos de tamanho_bloco valores"""
+    while True:
+        yield from choices(FACES_DADO, k=tamanho_bloco)
+
+
 def setup_jogo():
     """
     Instancia jogadores, randomiza suas posições e adiciona propriedades ao tabuleiro.
@@ -191,25 +290,19 @@ def setup_jogo():
 
     # Instancia os jogadores
     lista_jogadores = []
-    lista_jogadores.append(Jogador("Jogador1", 300, Comportamento(impulsivo=True)))
-    lista_jogadores.append(Jogador("Jogador2", 300, Comportamento(exigente=True)))
-    lista_jogadores.append(Jogador("Jogador3", 300, Comportamento(cauteloso=True)))
-    lista_jogadores.append(Jogador("Jogador4", 300, Comportamento(aleatorio=True)))
+    lista_jogadores.append(Jogador("Jogador1", 300, Comportamento(IMPULSIVO)))
+    lista_jogadores.append(Jogador("Jogador2", 300, Comportamento(EXIGENTE)))
+    lista_jogadores.append(Jogador("Jogador3", 300, Comportamento(CAUTELOSO)))
+    lista_jogadores.append(Jogador("Jogador4", 300, Comportamento(ALEATORIO)))
 
     # Randomiza a lista de jogadores
     shuffle(lista_jogadores)
 
     # Instancia a lista de propriedades
-    lista_propriedades = []
-    # Adiciona as propriedades ao tabuleiro
-    for prop in propriedades.lista:
-        lista_propriedades.append(
-            Propriedade(
-                nome = prop["nome"],
-                custo_venda = prop["custo_venda"],
-                valor_aluguel = prop["valor_aluguel"]
-            )
-        )
+    lista_propriedades = [
+        Propriedade(nome, custo_venda, valor_aluguel)
+        for nome, custo_venda, valor_aluguel in DADOS_PROPRIEDADES
+    ]
 
     # Instancia o jogo
     jogo = Jogo(
@@ -224,43 +317,91 @@ def inicia_jogo(jogo):
     return jogo.play()
 
 
-if __name__ == "__main__":
-    turnos = 300
+def inicia_worker():
+    """Semeia o gerador aleatório de cada processo para evitar sequências repetidas"""
+    seed(os.getpid() ^ time.time_ns())
+
 
-    resultado_final = {
-        "timeout": 0,
-        "turnos": 0,
-        "impulsivo": 0,
-        "exigente": 0,
-        "cauteloso": 0,
-        "aleatorio": 0
-    }
-    resultado_final_counter = Counter(resultado_final)
+def simula_bloco(quantidade, semente=None):
+    """
+    Joga um bloco de partidas e contabiliza os resultados. Usado pelos processos do Pool.
 
+    Args:
+        quantidade (int): Número de partidas do bloco
+        semente (str): Semente do gerador aleatório para o bloco. Se None, usa
+            o estado do gerador do processo.
 
-    for i in range(turnos):
-        #print(f"\r\n ========== Iniciando jogo número {i} ========== \r\n")
-        jogo = setup_jogo()
-        resultado = inicia_jogo(jogo)
-        resultado_final_counter += resultado
+    Retorna: lista [timeouts, turnos, vitórias de cada comportamento...]
+    """
+    if semente is not None:
+        seed(semente)
+
+    resultado_bloco = [0] * TAMANHO_RESULTADO
+    # O mesmo jogo é reaproveitado em todas as partidas do bloco
+    jogo = setup_jogo()
+
+    for _ in range(quantidade):
+        time_out, rodadas, indice_vencedor = inicia_jogo(jogo)
+        resultado_bloco[TIMEOUT] += time_out
+        resultado_bloco[TURNOS] += rodadas
+        resultado_bloco[VITORIAS + indice_vencedor] += 1
+
+    return resultado_bloco
+
+
+def simula_partidas(quantidade, processos=None, semente=None):
+    """
+    Simula um lote de partidas independentes em paralelo e acumula os resultados.
+
+    As partidas são divididas em um bloco contíguo por processo, de modo que
+    cada processo recebe uma única tarefa e devolve apenas os totais do seu bloco.
+
+    Args:
+        quantidade (int): Número de partidas a simular
+        processos (int): Número de processos, limitado ao número de partidas.
+            Padrão: número de CPUs
+        semente (int): Semente para uma simulação reproduzível. Cada bloco é
+            semeado com o texto "semente:índice do bloco", de modo que blocos
+            de sementes diferentes nunca compartilham a mesma sequência. O
+            resultado depende apenas de quantidade, processos e semente. Se
+            None, cada processo é semeado aleatoriamente.
+
+    Retorna: lista [timeouts, turnos, vitórias de cada comportamento...]
+    """
+    processos = processos or os.cpu_count() or 1
+    # Não cria processos sem partidas para jogar
+    processos = min(processos, quantidade) or 1
+    tamanho_bloco, resto = divmod(quantidade, processos)
+    blocos = [
+        (tamanho_bloco + (i < resto), None if semente is None else f"{semente}:{i}")
+        for i in range(processos)
+    ]
+
+    with Pool(processos, initializer=inicia_worker) as pool:
+        parciais = pool.starmap(simula_bloco, blocos)
+
+    return [sum(valores) for valores in zip(*parciais)]
+
+
+if __name__ == "__main__":
+    turnos = 300
 
-    resultado_final.update(dict(resultado_final_counter))
+    resultado_final = simula_partidas(turnos)
 
-    porcentagem_vitorias_comportamento = {
-        "impulsivo": (resultado_final["impulsivo"]/turnos) * 100,
-        "exigente": (resultado_final["exigente"]/turnos) * 100,
-        "cauteloso": (resultado_final["cauteloso"]/turnos) * 100,
-        "aleatorio": (resultado_final["aleatorio"]/turnos) * 100
-    }
+    porcentagem_vitorias_comportamento = [
+        (vitorias/turnos) * 100 for vitorias in resultado_final[VITORIAS:]
+    ]
 
-    comportamento_vencedor = max(porcentagem_vitorias_comportamento.items(), key=operator.itemgetter(1))[0]
+    comportamento_vencedor = COMPORTAMENTOS[
+        max(range(len(COMPORTAMENTOS)), key=porcentagem_vitorias_comportamento.__getitem__)
+    ]
 
     print(f"\r\n === RESULTADOS === \r\n")
-    print(f"Partidas terminadas por timeout: {resultado_final['timeout']:.0f}")
-    print(f"Média de turnos por partida: {resultado_final['turnos']/turnos}")
+    print(f"Partidas terminadas por timeout: {resultado_final[TIMEOUT]:.0f}")
+    print(f"Média de turnos por partida: {resultado_final[TURNOS]/turnos}")
     print(f"Porcentagem de vitórias por comportamento:")
-    print(f"\t Impulsivo: {porcentagem_vitorias_comportamento['impulsivo']:.2f}%")
-    print(f"\t Exigente: {porcentagem_vitorias_comportamento['exigente']:.2f}%")
-    print(f"\t Cauteloso: {porcentagem_vitorias_comportamento['cauteloso']:.2f}%")
-    print(f"\t Aleatório: {porcentagem_vitorias_comportamento['aleatorio']:.2f}%")
-    print(f"Comportamento que mais vence: {comportamento_vencedor}")
\ No newline at end of file
+    print(f"\t Impulsivo: {porcentagem_vitorias_comportamento[IMPULSIVO]:.2f}%")
+    print(f"\t Exigente: {porcentagem_vitorias_comportamento[EXIGENTE]:.2f}%")
+    print(f"\t Cauteloso: {porcentagem_vitorias_comportamento[CAUTELOSO]:.2f}%")
+    print(f"\t Aleatório: {porcentagem_vitorias_comportamento[ALEATORIO]:.2f}%")
+    print(f"Comportamento que mais vence: {comportamento_vencedor}")